@@ -1,24 +1,56 @@
 import xarray as xr
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import os
+import hashlib
+import argparse
 
 # Configuration
 CENTRAL_GIRDER_ELEMENTS = [15, 24, 33, 42, 51, 60, 69, 78, 83]
 XARRAY_DATA_PATH = "data/screening_task (2).nc"
 OUTPUT_FOLDER = "output"
 HATCHING_DENSITY = 5
+# Interpolation weights for HATCHING_DENSITY, shared by every hatching call
+HATCH_WEIGHTS = np.linspace(0.0, 1.0, HATCHING_DENSITY + 2)
+# Shared by every CSV export so they all use the same layout (4 decimals is plenty for inspection)
+CSV_WRITE_OPTIONS = dict(float_format='%.4f', lineterminator='\n')
+# Set XPP_INTERACTIVE=1 to open figures after saving them
+INTERACTIVE = os.environ.get('XPP_INTERACTIVE', '0') == '1'
 
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+def top_n_indices(scores, n=5):
+    # Largest first; the stable sort keeps ties in row order like nlargest(keep='first')
+    return np.argsort(-scores, kind='stable')[:n]
+
+def write_csv_if_changed(df, path):
+    # Skip the export when neither the table nor the CSV on disk changed since the last write.
+    # Only useful for numeric frames: tobytes() on object columns hashes pointers, never matching.
+    digest = hashlib.blake2b(df.to_numpy().tobytes())
+    digest.update(repr((list(df.index), list(df.columns), CSV_WRITE_OPTIONS)).encode())
+    digest = digest.hexdigest()
+    hash_path = path + '.blake2b'
+    
+    if os.path.exists(path) and os.path.exists(hash_path):
+        stat = os.stat(path)
+        with open(hash_path) as f:
+            if f.read().split() == [digest, str(stat.st_size), str(stat.st_mtime_ns)]:
+                return False
+    
+    df.to_csv(path, **CSV_WRITE_OPTIONS)
+    
+    # Record the file's size and mtime too, so a checkout or hand edit forces a rewrite
+    stat = os.stat(path)
+    with open(hash_path, 'w') as f:
+        f.write(f"{digest}\n{stat.st_size}\n{stat.st_mtime_ns}\n")
+    return True
+
 def analyze_all_elements(dataset):
     # Perform statistical analysis on all elements 
     print("\n Analyzing all elements...")
     
-    df = dataset.forces.to_dataframe().reset_index()
-    pivot_df = df.pivot(index='Element', columns='Component', values='forces')
+    # forces is already (Element, Component), so convert directly instead of melt + pivot
+    pivot_df = dataset.forces.to_pandas()
     pivot_df_clean = pivot_df.dropna(axis=1, how='all')
     
     print(f"Found {len(pivot_df_clean.columns)} force components")
@@ -27,70 +59,99 @@ def analyze_all_elements(dataset):
     print("CRITICAL ELEMENTS")
     print("="*60)
     
-    for component in pivot_df_clean.columns:
-        max_elem = pivot_df_clean[component].abs().idxmax()
-        max_val = pivot_df_clean.loc[max_elem, component]
+    # One reduction for all components instead of a column scan + .loc lookup each
+    forces_arr = pivot_df_clean.to_numpy()
+    max_rows = np.nanargmax(np.abs(forces_arr), axis=0)
+    max_elems = pivot_df_clean.index[max_rows]
+    max_vals = forces_arr[max_rows, np.arange(forces_arr.shape[1])]
+    
+    for component, max_elem, max_val in zip(pivot_df_clean.columns, max_elems, max_vals):
         print(f"{component:12s}: Element {max_elem:2d} = {max_val:10.2f}")
     
-    moment_cols = [c for c in pivot_df_clean.columns if 'M' in c]
-    shear_cols = [c for c in pivot_df_clean.columns if 'V' in c]
+    comp_names = pivot_df_clean.columns.to_numpy().astype(str)
+    m_mask = np.char.find(comp_names, 'M') >= 0
+    v_mask = np.char.find(comp_names, 'V') >= 0
     
     print("\n" + "="*60)
     print("TOP 5 MOMENTS")
     print("="*60)
-    moments_df = pivot_df_clean[moment_cols]
-    moments_df['Max_Moment'] = moments_df.abs().max(axis=1)
-    top_moments = moments_df.nlargest(5, 'Max_Moment')
+    max_moments = np.nanmax(np.abs(forces_arr[:, m_mask]), axis=1)
+    top_idx = top_n_indices(max_moments, 5)
+    top_moments = pivot_df_clean.iloc[top_idx, m_mask].copy()
+    top_moments['Max_Moment'] = max_moments[top_idx]
     print(top_moments)
     
     print("\n" + "="*60)
     print("TOP 5 SHEAR FORCES")
     print("="*60)
-    shears_df = pivot_df_clean[shear_cols]
-    shears_df['Max_Shear'] = shears_df.abs().max(axis=1)
-    top_shears = shears_df.nlargest(5, 'Max_Shear')
+    max_shears = np.nanmax(np.abs(forces_arr[:, v_mask]), axis=1)
+    top_idx = top_n_indices(max_shears, 5)
+    top_shears = pivot_df_clean.iloc[top_idx, v_mask].copy()
+    top_shears['Max_Shear'] = max_shears[top_idx]
     print(top_shears)
     
-    pivot_df_clean.to_csv(os.path.join(OUTPUT_FOLDER, 'forces_complete.csv'))
-    top_moments.to_csv(os.path.join(OUTPUT_FOLDER, 'critical_moments.csv'))
-    top_shears.to_csv(os.path.join(OUTPUT_FOLDER, 'critical_shears.csv'))
+    exported = ['critical_moments.csv', 'critical_shears.csv']
+    if write_csv_if_changed(pivot_df_clean, os.path.join(OUTPUT_FOLDER, 'forces_complete.csv')):
+        exported.insert(0, 'forces_complete.csv')
+    else:
+        print("\n forces_complete.csv unchanged, skipped rewrite")
+    top_moments.to_csv(os.path.join(OUTPUT_FOLDER, 'critical_moments.csv'), **CSV_WRITE_OPTIONS)
+    top_shears.to_csv(os.path.join(OUTPUT_FOLDER, 'critical_shears.csv'), **CSV_WRITE_OPTIONS)
     
-    print(f"\n Exported: forces_complete.csv, critical_moments.csv, critical_shears.csv")
+    print(f"\n Exported: {', '.join(exported)}")
 
 def load_xarray_data(file_path):
     ds = xr.open_dataset(file_path)
+    # forces is small; read it once so later selections don't re-decode from disk
+    ds['forces'].load()
     print(f"✓ Loaded dataset: {ds.dims}")
     return ds
 
 def extract_girder_data(dataset, element_ids):
     forces = dataset['forces']
-    girder_forces = forces.sel(Element=element_ids)
+    girder_forces = forces.sel(Element=element_ids).values
+    comp_index = {str(c): i for i, c in enumerate(forces.Component.values)}
     
-    mz_i = girder_forces.sel(Component='Mz_i').values
-    mz_j = girder_forces.sel(Component='Mz_j').values
-    vy_i = girder_forces.sel(Component='Vy_i').values
-    vy_j = girder_forces.sel(Component='Vy_j').values
+    mz_i = girder_forces[:, comp_index['Mz_i']]
+    mz_j = girder_forces[:, comp_index['Mz_j']]
+    vy_i = girder_forces[:, comp_index['Vy_i']]
+    vy_j = girder_forces[:, comp_index['Vy_j']]
     
     n_elements = len(element_ids)
-    mz_values = np.concatenate([mz_i, [mz_j[-1]]])
-    vy_values = np.concatenate([vy_i, [vy_j[-1]]])
+    # Node values: every element's i-end plus the last element's j-end
+    mz_values = np.empty(n_elements + 1, dtype=mz_i.dtype)
+    mz_values[:n_elements] = mz_i
+    mz_values[n_elements] = mz_j[-1]
+    vy_values = np.empty(n_elements + 1, dtype=vy_i.dtype)
+    vy_values[:n_elements] = vy_i
+    vy_values[n_elements] = vy_j[-1]
     positions = np.arange(n_elements + 1)
     
     return mz_values, vy_values, positions
 
 def create_hatching_lines(positions, values, density=5):
-    hatching_positions = []
-    hatching_values = []
+    # Interpolate every segment at once: (n_segments, density + 2) grid, flattened
+    positions = np.asarray(positions, dtype=float)
+    values = np.asarray(values, dtype=float)
+    t = HATCH_WEIGHTS if density == HATCHING_DENSITY else np.linspace(0.0, 1.0, density + 2)
     
-    for i in range(len(positions) - 1):
-        x_interp = np.linspace(positions[i], positions[i+1], density + 2)
-        y_interp = np.linspace(values[i], values[i+1], density + 2)
-        hatching_positions.extend(x_interp)
-        hatching_values.extend(y_interp)
+    p0, p1 = positions[:-1, None], positions[1:, None]
+    v0, v1 = values[:-1, None], values[1:, None]
+    hatching_positions = (p0 + (p1 - p0) * t).ravel()
+    hatching_values = (v0 + (v1 - v0) * t).ravel()
     
-    return np.array(hatching_positions), np.array(hatching_values)
+    return hatching_positions, hatching_values
 
 def plot_2d_diagrams_plotly(mz_values, vy_values, positions, element_ids):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    
+    # Reductions used by the annotations, computed once per diagram
+    max_mz_idx = int(np.abs(mz_values).argmax())
+    max_vy_idx = int(np.abs(vy_values).argmax())
+    mz_min, mz_max = float(mz_values.min()), float(mz_values.max())
+    y_pos = mz_min * 1.15 if mz_min < 0 else mz_max * 0.1
+    
     fig = make_subplots(
         rows=2, cols=1,
         subplot_titles=('Bending Moment Diagram (BMD)', 'Shear Force Diagram (SFD)'),
@@ -100,12 +161,16 @@ def plot_2d_diagrams_plotly(mz_values, vy_values, positions, element_ids):
     
     hatch_pos_mz, hatch_val_mz = create_hatching_lines(positions, mz_values, HATCHING_DENSITY)
     
+    hatch_xs, hatch_ys = [], []
     for pos, val in zip(hatch_pos_mz, hatch_val_mz):
-        fig.add_trace(
-            go.Scatter(x=[pos, pos], y=[0, val], mode='lines',
-                      line=dict(color='red', width=1), showlegend=False, hoverinfo='skip'),
-            row=1, col=1
-        )
+        hatch_xs.extend([pos, pos, None])
+        hatch_ys.extend([0, val, None])
+    
+    fig.add_trace(
+        go.Scatter(x=hatch_xs, y=hatch_ys, mode='lines',
+                  line=dict(color='red', width=1), showlegend=False, hoverinfo='skip'),
+        row=1, col=1
+    )
     
     fig.add_trace(
         go.Scatter(x=positions, y=mz_values, line=dict(color='darkred', width=3),
@@ -115,7 +180,6 @@ def plot_2d_diagrams_plotly(mz_values, vy_values, positions, element_ids):
     
     fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=2.5, row=1, col=1)
     
-    max_mz_idx = np.argmax(np.abs(mz_values))
     max_mz_val = mz_values[max_mz_idx]
     fig.add_annotation(
         x=positions[max_mz_idx], y=max_mz_val, text=f"Max: {max_mz_val:.2f} kN·m",
@@ -123,21 +187,25 @@ def plot_2d_diagrams_plotly(mz_values, vy_values, positions, element_ids):
         bordercolor="red", borderwidth=2, row=1, col=1
     )
     
-    for i, elem_id in enumerate(element_ids):
-        fig.add_annotation(
-            x=i + 0.5, y=min(mz_values) * 1.15 if min(mz_values) < 0 else max(mz_values) * 0.1,
-            text=f"E{elem_id}", showarrow=False, font=dict(size=9, color="green", family="Arial Black"),
-            row=1, col=1
-        )
+    # Element labels go into the layout in one batch (x/y are the BMD panel's axes)
+    element_labels = [
+        dict(x=i + 0.5, y=y_pos, xref='x', yref='y',
+             text=f"E{elem_id}", showarrow=False, font=dict(size=9, color="green", family="Arial Black"))
+        for i, elem_id in enumerate(element_ids)
+    ]
     
     hatch_pos_vy, hatch_val_vy = create_hatching_lines(positions, vy_values, HATCHING_DENSITY)
     
+    hatch_xs, hatch_ys = [], []
     for pos, val in zip(hatch_pos_vy, hatch_val_vy):
-        fig.add_trace(
-            go.Scatter(x=[pos, pos], y=[0, val], mode='lines',
-                      line=dict(color='blue', width=1), showlegend=False, hoverinfo='skip'),
-            row=2, col=1
-        )
+        hatch_xs.extend([pos, pos, None])
+        hatch_ys.extend([0, val, None])
+    
+    fig.add_trace(
+        go.Scatter(x=hatch_xs, y=hatch_ys, mode='lines',
+                  line=dict(color='blue', width=1), showlegend=False, hoverinfo='skip'),
+        row=2, col=1
+    )
     
     fig.add_trace(
         go.Scatter(x=positions, y=vy_values, line=dict(color='darkblue', width=3),
@@ -147,7 +215,6 @@ def plot_2d_diagrams_plotly(mz_values, vy_values, positions, element_ids):
     
     fig.add_hline(y=0, line_dash="solid", line_color="black", line_width=2.5, row=2, col=1)
     
-    max_vy_idx = np.argmax(np.abs(vy_values))
     max_vy_val = vy_values[max_vy_idx]
     fig.add_annotation(
         x=positions[max_vy_idx], y=max_vy_val, text=f"Max: {max_vy_val:.2f} kN",
@@ -163,17 +230,25 @@ def plot_2d_diagrams_plotly(mz_values, vy_values, positions, element_ids):
     fig.update_layout(
         title_text="Central Longitudinal Girder (Girder 3) - SFD and BMD Analysis",
         title_font_size=16, showlegend=False, height=900, width=1200,
-        template='plotly_white', font=dict(size=12)
+        template='plotly_white', font=dict(size=12),
+        annotations=fig.layout.annotations + tuple(element_labels)
     )
     
     html_path = os.path.join(OUTPUT_FOLDER, "task1_2d_diagrams.html")
-    fig.write_html(html_path)
+    fig.write_html(html_path, include_plotlyjs='cdn', full_html=True)
     print(f"HTML saved: {html_path}")
-    fig.show()
+    if INTERACTIVE:
+        fig.show()
 
 def plot_2d_diagrams_matplotlib(mz_values, vy_values, positions, element_ids):
     import matplotlib.pyplot as plt
     
+    # Reductions used by the annotations, computed once per diagram
+    max_mz_idx = int(np.abs(mz_values).argmax())
+    max_vy_idx = int(np.abs(vy_values).argmax())
+    mz_min, mz_max = float(mz_values.min()), float(mz_values.max())
+    y_pos = mz_min * 1.15 if mz_min < 0 else mz_max * 0.1
+    
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10))
     fig.suptitle('Central Longitudinal Girder (Girder 3) - SFD and BMD Analysis', 
                  fontsize=18, fontweight='bold')
@@ -190,7 +265,6 @@ def plot_2d_diagrams_matplotlib(mz_values, vy_values, positions, element_ids):
     ax1.set_title('Bending Moment Diagram (BMD)', fontsize=15, fontweight='bold')
     ax1.grid(True, alpha=0.3, linestyle=':', linewidth=0.8)
     
-    max_mz_idx = np.argmax(np.abs(mz_values))
     max_mz_val = mz_values[max_mz_idx]
     ax1.annotate(f'Max: {max_mz_val:.2f} kN·m',
                 xy=(positions[max_mz_idx], max_mz_val), xytext=(20, 20), textcoords='offset points',
@@ -200,7 +274,6 @@ def plot_2d_diagrams_matplotlib(mz_values, vy_values, positions, element_ids):
     
     for i, elem_id in enumerate(element_ids):
         mid_pos = i + 0.5
-        y_pos = min(mz_values) * 1.15 if min(mz_values) < 0 else max(mz_values) * 0.1
         ax1.text(mid_pos, y_pos, f'E{elem_id}', ha='center', va='center',
                 fontsize=9, color='green', fontweight='bold',
                 bbox=dict(boxstyle='round,pad=0.3', facecolor='lightgreen', alpha=0.6))
@@ -217,7 +290,6 @@ def plot_2d_diagrams_matplotlib(mz_values, vy_values, positions, element_ids):
     ax2.set_title('Shear Force Diagram (SFD)', fontsize=15, fontweight='bold')
     ax2.grid(True, alpha=0.3, linestyle=':', linewidth=0.8)
     
-    max_vy_idx = np.argmax(np.abs(vy_values))
     max_vy_val = vy_values[max_vy_idx]
     ax2.annotate(f'Max: {max_vy_val:.2f} kN',
                 xy=(positions[max_vy_idx], max_vy_val), xytext=(20, 20), textcoords='offset points',
@@ -229,9 +301,15 @@ def plot_2d_diagrams_matplotlib(mz_values, vy_values, positions, element_ids):
     png_path = os.path.join(OUTPUT_FOLDER, 'task1_2d_diagrams.png')
     plt.savefig(png_path, dpi=300, bbox_inches='tight')
     print(f" PNG saved: {png_path}")
-    plt.show()
+    if INTERACTIVE:
+        plt.show()
 
 def main():
+    parser = argparse.ArgumentParser(description="SFD & BMD analysis of the central girder")
+    parser.add_argument('--csv-only', action='store_true',
+                        help="only run the element analysis and CSV export, skip plotting")
+    args = parser.parse_args()
+    
     print("\n Bridge Analysis - SFD & BMD")
     print("="*60)
     
@@ -239,6 +317,11 @@ def main():
     
     analyze_all_elements(dataset)
     
+    if args.csv_only:
+        print("\n Complete! Check 'output' folder for CSV files.")
+        print("="*60)
+        return
+    
     print(f"\n Plotting central girder: {CENTRAL_GIRDER_ELEMENTS}")
     mz_values, vy_values, positions = extract_girder_data(dataset, CENTRAL_GIRDER_ELEMENTS)
     
@@ -1,9 +1,8 @@
 
 import xarray as xr
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import os
+import argparse
 
 # Import node and element data
 import sys
@@ -46,72 +45,119 @@ GIRDERS = {
 }
 
 HATCHING_DENSITY = 8  # Increase for more hatching (5-15 recommended)
+# Interpolation weights for HATCHING_DENSITY, shared by every hatching call
+HATCH_WEIGHTS = np.linspace(0.0, 1.0, HATCHING_DENSITY + 2)
+# Set XPP_INTERACTIVE=1 to open figures after saving them
+INTERACTIVE = os.environ.get('XPP_INTERACTIVE', '0') == '1'
+
+
+# Node coordinates as an (N, 3) array indexed directly by node id
+NODE_XYZ = np.zeros((max(nodes) + 1, 3))
+for nid, xyz in nodes.items():
+    NODE_XYZ[nid] = xyz
 
 
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 def load_xarray_data(file_path):
     ds = xr.open_dataset(file_path)
+    # forces is small; read it once so later selections don't re-decode from disk
+    ds['forces'].load()
     print(f"Loaded dataset: {ds.dims}")
     return ds
 
-def extract_girder_forces(dataset, element_ids):
-    #Extract Mz and Vy values for specified elements
-    forces = dataset['forces']
-    girder_forces = forces.sel(Element=element_ids)
+def export_pngs(figs, png_paths):
+    # pio.write_images renders every figure in a single Kaleido session
+    import plotly.io as pio
     
-    mz_i = girder_forces.sel(Component='Mz_i').values
-    mz_j = girder_forces.sel(Component='Mz_j').values
-    vy_i = girder_forces.sel(Component='Vy_i').values
-    vy_j = girder_forces.sel(Component='Vy_j').values
+    pio.write_images(figs, png_paths, width=1400, height=800, scale=2)
+    for png_path in png_paths:
+        print(f"PNG saved: {png_path}")
+
+def extract_girder_forces(girder_forces, comp_index):
+    #Extract Mz and Vy values from a girder's (Element, Component) force rows
+    mz_i = girder_forces[:, comp_index['Mz_i']]
+    mz_j = girder_forces[:, comp_index['Mz_j']]
+    vy_i = girder_forces[:, comp_index['Vy_i']]
+    vy_j = girder_forces[:, comp_index['Vy_j']]
     
-    mz_values = np.concatenate([mz_i, [mz_j[-1]]])
-    vy_values = np.concatenate([vy_i, [vy_j[-1]]])
+    n_elements = mz_i.shape[0]
+    # Node values: every element's i-end plus the last element's j-end
+    mz_values = np.empty(n_elements + 1, dtype=mz_i.dtype)
+    mz_values[:n_elements] = mz_i
+    mz_values[n_elements] = mz_j[-1]
+    vy_values = np.empty(n_elements + 1, dtype=vy_i.dtype)
+    vy_values[:n_elements] = vy_i
+    vy_values[n_elements] = vy_j[-1]
     
     return mz_values, vy_values
 
 
+def build_force_index(dataset):
+    # Map element/component labels to array positions so all girders share one gather
+    forces = dataset['forces']
+    elem_index = {int(e): i for i, e in enumerate(forces.Element.values)}
+    comp_index = {str(c): i for i, c in enumerate(forces.Component.values)}
+    return forces.values, elem_index, comp_index
+
+def extract_all_girder_forces(dataset):
+    # Gather every girder element in one go, then split the rows per girder
+    forces_arr, elem_index, comp_index = build_force_index(dataset)
+    all_elements = [e for info in GIRDERS.values() for e in info['elements']]
+    rows = np.fromiter((elem_index[e] for e in all_elements), dtype=int, count=len(all_elements))
+    all_forces = forces_arr[rows]
+    
+    girder_forces = {}
+    start = 0
+    for girder_name, girder_info in GIRDERS.items():
+        stop = start + len(girder_info['elements'])
+        girder_forces[girder_name] = extract_girder_forces(all_forces[start:stop], comp_index)
+        start = stop
+    
+    return girder_forces
+
+
 def create_interpolated_points(x_coords, y_coords, z_coords, density=8):
     # Create interpolated points for denser hatching
-    x_interp, y_interp, z_interp = [], [], []
+    coords = np.column_stack([x_coords, y_coords, z_coords]).astype(float)
+    t = HATCH_WEIGHTS if density == HATCHING_DENSITY else np.linspace(0.0, 1.0, density + 2)
     
-    for i in range(len(x_coords) - 1):
-        x_seg = np.linspace(x_coords[i], x_coords[i+1], density + 2)
-        y_seg = np.linspace(y_coords[i], y_coords[i+1], density + 2)
-        z_seg = np.linspace(z_coords[i], z_coords[i+1], density + 2)
-        
-        x_interp.extend(x_seg)
-        y_interp.extend(y_seg)
-        z_interp.extend(z_seg)
+    # (n_segments, density + 2, 3) in a single broadcast
+    segs = coords[:-1, None, :] + (coords[1:, None, :] - coords[:-1, None, :]) * t[None, :, None]
     
-    return x_interp, y_interp, z_interp
+    return segs[..., 0].ravel().tolist(), segs[..., 1].ravel().tolist(), segs[..., 2].ravel().tolist()
 
 
 def create_3d_bridge_frame():
     # Create the base bridge frame structure
-    frame_lines_x = []
-    frame_lines_y = []
-    frame_lines_z = []
-    
-    for elem_id, node_pair in members.items():
-        node_start, node_end = node_pair
-        x1, y1, z1 = nodes[node_start]
-        x2, y2, z2 = nodes[node_end]
-        
-        frame_lines_x.extend([x1, x2, None])
-        frame_lines_y.extend([y1, y2, None])
-        frame_lines_z.extend([z1, z2, None])
+    node_pairs = np.array(list(members.values()))
+    starts, ends = node_pairs[:, 0], node_pairs[:, 1]
     
-    return frame_lines_x, frame_lines_y, frame_lines_z
+    # Each member is start, end, NaN break -> 3 slots per member
+    frame_lines = []
+    for axis in range(3):
+        line = np.empty(3 * len(node_pairs))
+        line[0::3] = NODE_XYZ[starts, axis]
+        line[1::3] = NODE_XYZ[ends, axis]
+        line[2::3] = np.nan
+        frame_lines.append(line)
+    
+    return tuple(frame_lines)
+
 
-def plot_3d_bmd(dataset, scale_factor=0.5):
+# The frame never changes, so build it once for every plot
+BRIDGE_FRAME = create_3d_bridge_frame()
+
+def plot_3d_bmd(girder_forces, scale_factor=0.5):
     #Create 3D Bending Moment Diagram
+    import plotly.graph_objects as go
     
-    fig = go.Figure()
+    # Collect every trace first and build the figure once at the end
+    traces = []
     
     # Add bridge frame
-    frame_x, frame_y, frame_z = create_3d_bridge_frame()
-    fig.add_trace(go.Scatter3d(
+    frame_x, frame_y, frame_z = BRIDGE_FRAME
+    traces.append(go.Scatter3d(
         x=frame_x, y=frame_y, z=frame_z,
         mode='lines',
         line=dict(color='lightgray', width=2),
@@ -121,22 +167,21 @@ def plot_3d_bmd(dataset, scale_factor=0.5):
     
     # Plot each girder with extruded moments
     for girder_name, girder_info in GIRDERS.items():
-        element_ids = girder_info['elements']
         node_ids = girder_info['nodes']
         color = girder_info['color']
         
         # Get moment values
-        mz_values, _ = extract_girder_forces(dataset, element_ids)
+        mz_values, _ = girder_forces[girder_name]
         
         # Get node coordinates
-        x_coords = [nodes[nid][0] for nid in node_ids]
-        z_coords = [nodes[nid][2] for nid in node_ids]
+        x_coords = NODE_XYZ[node_ids, 0]
+        z_coords = NODE_XYZ[node_ids, 2]
         
         # Extrude moments in Y direction
-        y_coords = [mz * scale_factor for mz in mz_values]
+        y_coords = mz_values * scale_factor
         
         # Plot the extruded moment diagram
-        fig.add_trace(go.Scatter3d(
+        traces.append(go.Scatter3d(
             x=x_coords,
             y=y_coords,
             z=z_coords,
@@ -149,19 +194,23 @@ def plot_3d_bmd(dataset, scale_factor=0.5):
         
         # Add vertical lines from baseline to moment value
         x_hatch, y_hatch, z_hatch = create_interpolated_points(x_coords, y_coords, z_coords, HATCHING_DENSITY)
+        x_hatch_all, y_hatch_all, z_hatch_all = [], [], []
         for x, y, z in zip(x_hatch, y_hatch, z_hatch):
-            fig.add_trace(go.Scatter3d(
-                x=[x, x],
-                y=[0, y],
-                z=[z, z],
-                mode='lines',
-                line=dict(color=color, width=1),
-                showlegend=False,
-                hoverinfo='skip'
-            ))
-    
-    # Update layout
-    fig.update_layout(
+            x_hatch_all.extend([x, x, None])
+            y_hatch_all.extend([0, y, None])
+            z_hatch_all.extend([z, z, None])
+        
+        traces.append(go.Scatter3d(
+            x=x_hatch_all,
+            y=y_hatch_all,
+            z=z_hatch_all,
+            mode='lines',
+            line=dict(color=color, width=1),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+    
+    fig = go.Figure(data=traces, layout=go.Layout(
         title="3D Bending Moment Diagram (BMD) - All Girders",
         scene=dict(
             xaxis_title="X (m) - Longitudinal",
@@ -177,27 +226,26 @@ def plot_3d_bmd(dataset, scale_factor=0.5):
         height=800,
         showlegend=True,
         template='plotly_white'
-    )
+    ))
     
     html_path = os.path.join(OUTPUT_FOLDER, "task2_3d_bmd.html")
-    fig.write_html(html_path)
+    fig.write_html(html_path, include_plotlyjs='cdn', full_html=True)
     print(f"3D BMD saved: {html_path}")
-    # Add PNG export
-    png_path = os.path.join(OUTPUT_FOLDER, "task2_3d_bmd.png")
-    fig.write_image(png_path, width=1400, height=800, scale=2)
-    print(f"PNG saved: {png_path}")
+    if INTERACTIVE:
+        fig.show()
+    return fig
 
-    fig.show()
 
-
-def plot_3d_sfd(dataset, scale_factor=2.0):
+def plot_3d_sfd(girder_forces, scale_factor=2.0):
     # Create 3D Shear Force Diagram
+    import plotly.graph_objects as go
     
-    fig = go.Figure()
+    # Collect every trace first and build the figure once at the end
+    traces = []
     
     # Add bridge frame
-    frame_x, frame_y, frame_z = create_3d_bridge_frame()
-    fig.add_trace(go.Scatter3d(
+    frame_x, frame_y, frame_z = BRIDGE_FRAME
+    traces.append(go.Scatter3d(
         x=frame_x, y=frame_y, z=frame_z,
         mode='lines',
         line=dict(color='lightgray', width=2),
@@ -207,22 +255,21 @@ def plot_3d_sfd(dataset, scale_factor=2.0):
     
     # Plot each girder with extruded shear
     for girder_name, girder_info in GIRDERS.items():
-        element_ids = girder_info['elements']
         node_ids = girder_info['nodes']
         color = girder_info['color']
         
         # Get shear values
-        _, vy_values = extract_girder_forces(dataset, element_ids)
+        _, vy_values = girder_forces[girder_name]
         
         # Get node coordinates
-        x_coords = [nodes[nid][0] for nid in node_ids]
-        z_coords = [nodes[nid][2] for nid in node_ids]
+        x_coords = NODE_XYZ[node_ids, 0]
+        z_coords = NODE_XYZ[node_ids, 2]
         
         # Extrude shear in Y direction
-        y_coords = [vy * scale_factor for vy in vy_values]
+        y_coords = vy_values * scale_factor
         
         # Plot the extruded shear diagram
-        fig.add_trace(go.Scatter3d(
+        traces.append(go.Scatter3d(
             x=x_coords,
             y=y_coords,
             z=z_coords,
@@ -235,18 +282,23 @@ def plot_3d_sfd(dataset, scale_factor=2.0):
         
         # Add vertical lines from baseline to shear value
         x_hatch, y_hatch, z_hatch = create_interpolated_points(x_coords, y_coords, z_coords, HATCHING_DENSITY)
+        x_hatch_all, y_hatch_all, z_hatch_all = [], [], []
         for x, y, z in zip(x_hatch, y_hatch, z_hatch):
-            fig.add_trace(go.Scatter3d(
-                x=[x, x],
-                y=[0, y],
-                z=[z, z],
-                mode='lines',
-                line=dict(color=color, width=1),
-                showlegend=False,
-                hoverinfo='skip'
-            ))
-    # Update layout
-    fig.update_layout(
+            x_hatch_all.extend([x, x, None])
+            y_hatch_all.extend([0, y, None])
+            z_hatch_all.extend([z, z, None])
+        
+        traces.append(go.Scatter3d(
+            x=x_hatch_all,
+            y=y_hatch_all,
+            z=z_hatch_all,
+            mode='lines',
+            line=dict(color=color, width=1),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+    
+    fig = go.Figure(data=traces, layout=go.Layout(
         title="3D Shear Force Diagram (SFD) - All Girders",
         scene=dict(
             xaxis_title="X (m) - Longitudinal",
@@ -262,20 +314,19 @@ def plot_3d_sfd(dataset, scale_factor=2.0):
         height=800,
         showlegend=True,
         template='plotly_white'
-    )
+    ))
     
     html_path = os.path.join(OUTPUT_FOLDER, "task2_3d_sfd.html")
-    fig.write_html(html_path)
+    fig.write_html(html_path, include_plotlyjs='cdn', full_html=True)
     print(f" 3D SFD saved: {html_path}")
-    # Add PNG export
-    png_path = os.path.join(OUTPUT_FOLDER, "task2_3d_sfd.png")
-    fig.write_image(png_path, width=1400, height=800, scale=2)
-    print(f"PNG saved: {png_path}")
-    fig.show()
+    if INTERACTIVE:
+        fig.show()
+    return fig
 
-def plot_combined_3d(dataset):
+def plot_combined_3d(girder_forces):
     # Create combined view with both BMD and SFD side by side
     
+    import plotly.graph_objects as go
     from plotly.subplots import make_subplots
     
     fig = make_subplots(
@@ -285,46 +336,55 @@ def plot_combined_3d(dataset):
         horizontal_spacing=0.05
     )
     
+    # Collect traces for both scenes and add them in one batch; cols picks the scene
+    traces, cols = [], []
+    
     # BMD on left
-    frame_x, frame_y, frame_z = create_3d_bridge_frame()
-    fig.add_trace(go.Scatter3d(
+    frame_x, frame_y, frame_z = BRIDGE_FRAME
+    traces.append(go.Scatter3d(
         x=frame_x, y=frame_y, z=frame_z,
         mode='lines', line=dict(color='lightgray', width=2),
         name='Frame', showlegend=False
-    ), row=1, col=1)
+    ))
+    cols.append(1)
     
     for girder_name, girder_info in GIRDERS.items():
-        element_ids = girder_info['elements']
         node_ids = girder_info['nodes']
         color = girder_info['color']
         
-        mz_values, vy_values = extract_girder_forces(dataset, element_ids)
+        mz_values, vy_values = girder_forces[girder_name]
         
-        x_coords = [nodes[nid][0] for nid in node_ids]
-        z_coords = [nodes[nid][2] for nid in node_ids]
+        # Node coordinates are shared by both diagrams
+        x_coords = NODE_XYZ[node_ids, 0]
+        z_coords = NODE_XYZ[node_ids, 2]
+        y_mz = mz_values * 0.5
+        y_vy = vy_values * 2.0
         
         # BMD
-        y_mz = [mz * 0.5 for mz in mz_values]
-        fig.add_trace(go.Scatter3d(
+        traces.append(go.Scatter3d(
             x=x_coords, y=y_mz, z=z_coords,
             mode='lines+markers', line=dict(color=color, width=4),
             marker=dict(size=3), name=girder_name, showlegend=False
-        ), row=1, col=1)
+        ))
+        cols.append(1)
         
         # SFD
-        y_vy = [vy * 2.0 for vy in vy_values]
-        fig.add_trace(go.Scatter3d(
+        traces.append(go.Scatter3d(
             x=x_coords, y=y_vy, z=z_coords,
             mode='lines+markers', line=dict(color=color, width=4),
             marker=dict(size=3), name=girder_name, showlegend=False
-        ), row=1, col=2)
+        ))
+        cols.append(2)
     
     # Add frame to SFD
-    fig.add_trace(go.Scatter3d(
+    traces.append(go.Scatter3d(
         x=frame_x, y=frame_y, z=frame_z,
         mode='lines', line=dict(color='lightgray', width=2),
         name='Frame', showlegend=False
-    ), row=1, col=2)
+    ))
+    cols.append(2)
+    
+    fig.add_traces(traces, rows=[1] * len(traces), cols=cols)
     
     fig.update_layout(
         title_text="3D Force Diagrams - Complete Bridge Analysis",
@@ -346,11 +406,17 @@ def plot_combined_3d(dataset):
     fig.update_scenes(scene_props)
     
     html_path = os.path.join(OUTPUT_FOLDER, "task2_3d_combined.html")
-    fig.write_html(html_path)
+    fig.write_html(html_path, include_plotlyjs='cdn', full_html=True)
     print(f"✓ Combined 3D plot saved: {html_path}")
-    fig.show()
+    if INTERACTIVE:
+        fig.show()
 
 def main():
+    parser = argparse.ArgumentParser(description="3D SFD & BMD for all girders")
+    parser.add_argument('--export-png', action='store_true',
+                        help="also export static PNGs of the 3D BMD/SFD (requires kaleido)")
+    args = parser.parse_args()
+    
     print("\n Task 2: 3D SFD & BMD for All Girders")
     print("="*60)
     
@@ -360,10 +426,17 @@ def main():
     for name, info in GIRDERS.items():
         print(f"  • {name}: {len(info['elements'])} elements")
     
+    girder_forces = extract_all_girder_forces(dataset)
+    
     print("\nCreating 3D visualizations...")
-    plot_3d_bmd(dataset, scale_factor=0.5)
-    plot_3d_sfd(dataset, scale_factor=2.0)
-    plot_combined_3d(dataset)
+    bmd_fig = plot_3d_bmd(girder_forces, scale_factor=0.5)
+    sfd_fig = plot_3d_sfd(girder_forces, scale_factor=2.0)
+    plot_combined_3d(girder_forces)
+    
+    if args.export_png:
+        export_pngs([bmd_fig, sfd_fig],
+                    [os.path.join(OUTPUT_FOLDER, "task2_3d_bmd.png"),
+                     os.path.join(OUTPUT_FOLDER, "task2_3d_sfd.png")])
     
     print("\nComplete! Check 'output' folder for 3D plots.")
     print("  • task2_3d_bmd.html - Bending Moment Diagram")